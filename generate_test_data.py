@@ -47,5 +47,51 @@ def generate_test_data(num_rows=100, output_file="data/test_data.csv"):
     print(f"✅ Сгенерировано {num_rows} строк данных и сохранено в {output_file}")
 
 
+# Шаблоны вопросов: (поле с ответом, формулировка вопроса)
+QUESTION_TEMPLATES = [
+    ("Общая_выручка_по_заказу",
+     "Какова общая выручка по заказу продукта {product} для покупателя {customer} в периоде {period}?"),
+    ("Процент_удовлетворения_спроса",
+     "Какой процент удовлетворения спроса по продукту {product} у покупателя {customer} в периоде {period}?"),
+    ("Фактически_удовлетворённый_объём",
+     "Какой объём продукта {product} фактически удовлетворён для покупателя {customer} в периоде {period}?"),
+    ("Выручка_за_единицу",
+     "Какая выручка за единицу продукта {product} для покупателя {customer} в периоде {period}?"),
+]
+
+
+def generate_test_questions(data_file="data/test_data.csv", output_file="data/test_questions.csv",
+                            num_questions=50):
+    """
+    Генерирует размеченный набор вопросов по строкам из data_file.
+    Для каждого вопроса известна строка-ответ (row_id), что позволяет
+    измерять recall@k при подборе параметров поиска (см. tune_retrieval.py).
+    Берутся только строки с уникальной комбинацией период+покупатель+продукт,
+    чтобы правильный ответ был однозначным.
+    """
+    df = pd.read_csv(data_file)
+    key_columns = ["Период_планирования", "Покупатель_спроса", "Продукт_спроса"]
+    unique_rows = df[~df.duplicated(subset=key_columns, keep=False)]
+
+    sampled = unique_rows.sample(n=min(num_questions, len(unique_rows)))
+    questions = []
+    for _, row in sampled.iterrows():
+        answer_field, template = random.choice(QUESTION_TEMPLATES)
+        questions.append({
+            "question": template.format(
+                product=row["Продукт_спроса"],
+                customer=row["Покупатель_спроса"],
+                period=row["Период_планирования"],
+            ),
+            "row_id": int(row["id"]),
+            "answer": row[answer_field],
+        })
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    pd.DataFrame(questions).to_csv(output_file, index=False)
+    print(f"✅ Сгенерировано {len(questions)} вопросов и сохранено в {output_file}")
+
+
 if __name__ == "__main__":
     generate_test_data()
+    generate_test_questions()
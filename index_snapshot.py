@@ -0,0 +1,35 @@
+# index_snapshot.py
+import argparse
+import logging
+
+from src.vector_store import VectorStore
+from src.index_snapshot import export_snapshot, import_snapshot
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт и импорт снимков векторного индекса.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Сохранить активную коллекцию в файл снимка")
+    export_parser.add_argument("path", help="Путь к файлу снимка")
+    export_parser.add_argument("--no-compress-embeddings", action="store_true",
+                               help="Не сжимать эмбеддинги (позволяет импорт с --mmap)")
+
+    import_parser = subparsers.add_parser("import", help="Загрузить снимок в коллекцию без пересчёта эмбеддингов")
+    import_parser.add_argument("path", help="Путь к файлу снимка")
+    import_parser.add_argument("--mmap", action="store_true", help="Отобразить эмбеддинги в память")
+    args = parser.parse_args()
+
+    vector_store = VectorStore()
+    if args.command == "export":
+        header = export_snapshot(vector_store, args.path, compress_embeddings=not args.no_compress_embeddings)
+        print(f"✅ Экспортировано {header['count']} чанков в {args.path}")
+    else:
+        header = import_snapshot(vector_store, args.path, use_mmap=args.mmap)
+        print(f"✅ Импортировано {header['count']} чанков из {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,26 @@ EMBEDDING_MODEL_NAME = "nomic-embed-text:latest"   # ← именно так, к
 CHUNK_SIZE = 300
 CHUNK_OVERLAP = 50
 
+# Группировка строк при инжесте: None — отдельный документ на каждую строку,
+# иначе строки с общим ключом упаковываются в один документ до INGEST_GROUP_MAX_TOKENS токенов
+INGEST_GROUP_BY = None  # None, "product_period" или "customer_period"
+INGEST_GROUP_MAX_TOKENS = 1000  # С запасом меньше контекста nomic-embed-text (2048)
+INGEST_GROUP_KEYS = {
+    "product_period": ("Продукт_спроса", "Период_планирования"),
+    "customer_period": ("Покупатель_спроса", "Период_планирования"),
+}
+
+# Батчевые эмбеддинги через Ollama /api/embed
+EMBEDDING_HTTP_BATCH_SIZE = 64  # Максимум текстов в одном HTTP-запросе к Ollama
+EMBEDDING_HTTP_TIMEOUT = 120  # Таймаут запроса эмбеддингов, секунды
+
+# Микро-батчинг эмбеддингов запросов при одновременных поисках
+ENABLE_QUERY_EMBEDDING_BATCHING = True
+QUERY_EMBEDDING_BATCH_MAX_SIZE = 32  # Максимум запросов в одном вызове эмбеддинга
+QUERY_EMBEDDING_BATCH_MAX_WAIT_MS = 5  # Сколько ждать попутные запросы
+QUERY_EMBEDDING_MAX_IN_FLIGHT = 4  # Сколько батчей могут выполняться параллельно
+QUERY_EMBEDDING_RESULT_TIMEOUT = 180  # Сколько поиск ждёт эмбеддинг запроса, секунды
+
 # LLM
 OLLAMA_MODEL = "gemma3:4b"
 OLLAMA_BASE_URL = "http://localhost:11434"
@@ -20,3 +40,10 @@ OLLAMA_BASE_URL = "http://localhost:11434"
 # Векторное хранилище
 VECTOR_DB_PATH = "./chroma_db"
 COLLECTION_NAME = "demand_data_collection"
+
+# Снимки индекса (index_snapshot.py, /api/snapshot/*)
+SNAPSHOT_DIR = "./snapshots"
+SNAPSHOT_BATCH_SIZE = 1000  # Сколько чанков читать/добавлять за один вызов Chroma
+
+# Подбор параметров поиска (tune_retrieval.py)
+TUNING_COLLECTION_NAME = "demand_data_tuning"  # Временная коллекция, основной индекс не трогаем
@@ -0,0 +1,130 @@
+# src/embedding_batcher.py
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, List, Sequence
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class QueryEmbeddingBatcher:
+    """
+    Общий микро-батчер эмбеддингов запросов.
+    Собирает одновременные запросы в течение max_wait_ms (или до max_batch_size),
+    выполняет один батчевый вызов embed_fn (один HTTP-запрос к Ollama /api/embed)
+    и раздаёт каждому вызывающему его вектор. Пока батч выполняется, сборщик
+    продолжает собирать следующий; параллельно выполняется до max_in_flight батчей.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], Sequence[Any]], max_batch_size: int,
+                 max_wait_ms: float, max_in_flight: int = 1, result_timeout: float = 180.0):
+        self.embed_fn = embed_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max_wait_ms
+        self.max_in_flight = max(1, max_in_flight)
+        self.result_timeout = result_timeout
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._collector = None
+        self._requests = 0
+        self._batches = 0
+        self._embed_calls = 0
+        self._largest_batch = 0
+        self._errors = 0
+
+    def embed(self, text: str) -> Any:
+        """
+        Возвращает эмбеддинг одного запроса; блокирует до выполнения батча,
+        но не дольше result_timeout секунд.
+        """
+        self._ensure_collector()
+        future: Future = Future()
+        self._queue.put((text, future))
+        try:
+            return future.result(timeout=self.result_timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Эмбеддинг запроса не получен за {self.result_timeout} с")
+
+    def get_stats(self) -> dict:
+        """
+        Возвращает настройки и статистику батчинга.
+        embed_calls — фактическое число вызовов embed_fn (HTTP-запросов к Ollama),
+        embed_calls_saved — сколько запросов сэкономлено против вызова на каждый текст.
+        """
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "max_in_flight": self.max_in_flight,
+                "requests": self._requests,
+                "batches": self._batches,
+                "avg_batch_size": round(self._requests / self._batches, 2) if self._batches else 0.0,
+                "largest_batch": self._largest_batch,
+                "embed_calls": self._embed_calls,
+                "embed_calls_saved": self._requests - self._embed_calls,
+                "errors": self._errors,
+            }
+
+    def _ensure_collector(self):
+        with self._lock:
+            if self._collector is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                                    thread_name_prefix="query-embedding")
+                self._collector = threading.Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+                self._collector.start()
+
+    def _collect_batch(self) -> List[tuple]:
+        batch = [self._queue.get()]  # Ждём первый запрос без таймаута
+        deadline = time.monotonic() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            with self._lock:
+                self._requests += len(batch)
+                self._batches += 1
+                self._largest_batch = max(self._largest_batch, len(batch))
+            try:
+                self._executor.submit(self._embed_batch, batch)
+            except Exception as e:
+                # Например, пул уже остановлен при завершении интерпретатора:
+                # сборщик не должен умирать молча, ожидающие получают ошибку
+                for _, future in batch:
+                    self._fail(future, e)
+
+    def _embed_batch(self, batch: List[tuple]):
+        texts = [text for text, _ in batch]
+        try:
+            with self._lock:
+                self._embed_calls += 1
+            embeddings = self.embed_fn(texts)
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch[0][1], e)
+                return
+            # Ошибка батча не должна валить все запросы: повторяем каждый отдельно
+            logging.warning(f"⚠️ Батч эмбеддингов из {len(texts)} запросов не выполнен ({e}), повторяю поштучно.")
+            for item in batch:
+                self._embed_batch([item])
+            return
+
+        for (_, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
+
+    def _fail(self, future: Future, error: Exception):
+        logging.error(f"❌ Ошибка эмбеддинга запроса: {error}")
+        with self._lock:
+            self._errors += 1
+        future.set_exception(error)
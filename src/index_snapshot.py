@@ -0,0 +1,282 @@
+# src/index_snapshot.py
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zlib
+from typing import Dict, Any
+
+import numpy as np
+
+from src.vector_store import VectorStore, EMBEDDING_API
+from src.config import (
+    EMBEDDING_MODEL_NAME,
+    INGEST_GROUP_MAX_TOKENS,
+    SNAPSHOT_BATCH_SIZE
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Формат файла снимка:
+#   MAGIC | выравнивание до EMBEDDINGS_OFFSET | эмбеддинги float32 (count x dim, C-порядок)
+#   | payload (zlib, JSON-строки [id, документ, метаданные]) | заголовок JSON | длина заголовка (uint64) | MAGIC
+# Без сжатия эмбеддингов массив можно отобразить в память (np.memmap) прямо из файла.
+SNAPSHOT_MAGIC = b"RAGSNAP1"
+SNAPSHOT_FORMAT_VERSION = 1
+EMBEDDINGS_OFFSET = 64
+_FOOTER = struct.Struct("<Q8s")
+_READ_BLOCK_SIZE = 1024 * 1024
+SNAPSHOT_STAGING_SUFFIX = "_import"
+
+
+def _collection_chunking_config(vector_store: VectorStore) -> Dict[str, Any]:
+    """
+    Параметры индексации, сохранённые ingest_data в метаданных коллекции.
+    Коллекцию без метки embedding_api не экспортируем: её векторы посчитаны
+    старым эндпоинтом и несовместимы с узлом, который загрузит снимок.
+    """
+    metadata = vector_store.collection.metadata or {}
+    if metadata.get("embedding_api") != EMBEDDING_API:
+        raise ValueError(
+            f"Коллекция '{vector_store.collection_name}' не содержит метки embedding_api='{EMBEDDING_API}' "
+            f"(собрана до перехода на /api/embed или не заполнена инжестом). Выполните повторный инжест."
+        )
+    group_by = metadata["group_by"]
+    return {
+        "embedding_model": metadata["embedding_model"],
+        "embedding_api": metadata["embedding_api"],
+        "chunk_size": metadata["chunk_size"],
+        "chunk_overlap": metadata["chunk_overlap"],
+        "group_by": None if group_by == "none" else group_by,
+        "group_max_tokens": metadata["group_max_tokens"],
+    }
+
+
+def export_snapshot(vector_store: VectorStore, file_path: str, compress_embeddings: bool = True) -> Dict[str, Any]:
+    """
+    Сериализует активную коллекцию в один сжатый файл с контрольными суммами.
+    При compress_embeddings=False эмбеддинги хранятся как есть и могут быть
+    отображены в память при импорте. Возвращает заголовок снимка.
+    """
+    config = _collection_chunking_config(vector_store)
+    count = vector_store.collection.count()
+    logging.info(f"Экспорт снимка коллекции '{vector_store.collection_name}' ({count} чанков) в {file_path}...")
+
+    output_dir = os.path.dirname(file_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+
+    embeddings_hash = hashlib.sha256()
+    payload_hash = hashlib.sha256()
+    embeddings_compressor = zlib.compressobj(6) if compress_embeddings else None
+    payload_compressor = zlib.compressobj(9)
+    dim = None
+
+    try:
+        with open(tmp_path, "wb") as f, tempfile.TemporaryFile() as payload_file:
+            f.write(SNAPSHOT_MAGIC.ljust(EMBEDDINGS_OFFSET, b"\0"))
+
+            def write_embeddings(data: bytes):
+                if data:
+                    embeddings_hash.update(data)
+                    f.write(data)
+
+            def write_payload(data: bytes):
+                if data:
+                    payload_hash.update(data)
+                    payload_file.write(data)
+
+            for offset in range(0, count, SNAPSHOT_BATCH_SIZE):
+                batch = vector_store.collection.get(
+                    include=["embeddings", "documents", "metadatas"],
+                    limit=SNAPSHOT_BATCH_SIZE,
+                    offset=offset
+                )
+                embeddings = np.ascontiguousarray(batch["embeddings"], dtype=np.float32)
+                if dim is None:
+                    dim = embeddings.shape[1]
+                elif embeddings.shape[1] != dim:
+                    raise ValueError(f"Разная размерность эмбеддингов в коллекции: {dim} и {embeddings.shape[1]}")
+
+                raw = embeddings.tobytes()
+                write_embeddings(embeddings_compressor.compress(raw) if embeddings_compressor else raw)
+
+                lines = "".join(
+                    json.dumps([doc_id, document, metadata], ensure_ascii=False) + "\n"
+                    for doc_id, document, metadata in zip(batch["ids"], batch["documents"], batch["metadatas"])
+                )
+                write_payload(payload_compressor.compress(lines.encode("utf-8")))
+
+            if embeddings_compressor:
+                write_embeddings(embeddings_compressor.flush())
+            write_payload(payload_compressor.flush())
+
+            embeddings_length = f.tell() - EMBEDDINGS_OFFSET
+            payload_offset = f.tell()
+            payload_file.seek(0)
+            shutil.copyfileobj(payload_file, f)
+
+            header = {
+                "format_version": SNAPSHOT_FORMAT_VERSION,
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "collection_name": vector_store.collection_name,
+                "embedding_model": config["embedding_model"],
+                "embedding_api": config["embedding_api"],
+                "chunking": {
+                    "chunk_size": config["chunk_size"],
+                    "chunk_overlap": config["chunk_overlap"],
+                    "group_by": config["group_by"],
+                    "group_max_tokens": config["group_max_tokens"],
+                },
+                "count": count,
+                "dim": dim or 0,
+                "dtype": "float32",
+                "embeddings": {
+                    "offset": EMBEDDINGS_OFFSET,
+                    "length": embeddings_length,
+                    "compression": "zlib" if compress_embeddings else "none",
+                    "sha256": embeddings_hash.hexdigest(),
+                },
+                "payload": {
+                    "offset": payload_offset,
+                    "length": f.tell() - payload_offset,
+                    "compression": "zlib",
+                    "sha256": payload_hash.hexdigest(),
+                },
+            }
+            header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+            f.write(header_bytes)
+            f.write(_FOOTER.pack(len(header_bytes), SNAPSHOT_MAGIC))
+
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        # Не оставляем недописанный снимок рядом с целевым файлом
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    logging.info(f"✅ Снимок сохранён: {file_path} ({os.path.getsize(file_path)} байт)")
+    return header
+
+
+def read_snapshot_header(file_path: str) -> Dict[str, Any]:
+    """
+    Читает заголовок снимка без загрузки данных.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"{file_path} не является снимком индекса")
+        if file_size < EMBEDDINGS_OFFSET + _FOOTER.size:
+            raise ValueError(f"Снимок {file_path} повреждён или обрезан")
+        f.seek(-_FOOTER.size, os.SEEK_END)
+        header_length, magic = _FOOTER.unpack(f.read(_FOOTER.size))
+        if magic != SNAPSHOT_MAGIC or header_length > file_size - EMBEDDINGS_OFFSET - _FOOTER.size:
+            raise ValueError(f"Снимок {file_path} повреждён или обрезан")
+        f.seek(-_FOOTER.size - header_length, os.SEEK_END)
+        try:
+            header = json.loads(f.read(header_length).decode("utf-8"))
+        except ValueError:
+            raise ValueError(f"Снимок {file_path} повреждён или обрезан")
+
+    if header.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия формата снимка: {header.get('format_version')}")
+    return header
+
+
+def _verify_section(f, section: Dict[str, Any], name: str):
+    f.seek(section["offset"])
+    digest = hashlib.sha256()
+    remaining = section["length"]
+    while remaining > 0:
+        block = f.read(min(_READ_BLOCK_SIZE, remaining))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+    if remaining or digest.hexdigest() != section["sha256"]:
+        raise ValueError(f"Контрольная сумма раздела '{name}' не совпадает: снимок повреждён")
+
+
+def _read_section(f, section: Dict[str, Any]) -> bytes:
+    f.seek(section["offset"])
+    data = f.read(section["length"])
+    return zlib.decompress(data) if section["compression"] == "zlib" else data
+
+
+def import_snapshot(vector_store: VectorStore, file_path: str, use_mmap: bool = False) -> Dict[str, Any]:
+    """
+    Загружает снимок в коллекцию vector_store, не пересчитывая эмбеддинги.
+    Отказывает, если модель эмбеддингов снимка не совпадает с EMBEDDING_MODEL_NAME
+    или векторы посчитаны другим эндпоинтом (метка embedding_api).
+    use_mmap=True отображает эмбеддинги в память (только для снимков без их сжатия).
+    Возвращает заголовок снимка.
+    """
+    header = read_snapshot_header(file_path)
+    if header["embedding_model"] != EMBEDDING_MODEL_NAME:
+        raise ValueError(
+            f"Модель эмбеддингов снимка '{header['embedding_model']}' не совпадает "
+            f"с EMBEDDING_MODEL_NAME '{EMBEDDING_MODEL_NAME}'"
+        )
+    if header.get("embedding_api") != EMBEDDING_API:
+        raise ValueError(
+            f"Снимок собран с embedding_api='{header.get('embedding_api')}', "
+            f"узел считает эмбеддинги через '{EMBEDDING_API}': векторы несовместимы"
+        )
+    if use_mmap and header["embeddings"]["compression"] != "none":
+        raise ValueError("Эмбеддинги в снимке сжаты, отображение в память невозможно")
+
+    count, dim = header["count"], header["dim"]
+    logging.info(f"Импорт снимка {file_path} ({count} чанков, dim={dim}, mmap={use_mmap})...")
+
+    with open(file_path, "rb") as f:
+        _verify_section(f, header["embeddings"], "embeddings")
+        _verify_section(f, header["payload"], "payload")
+
+        if use_mmap and count:
+            embeddings = np.memmap(file_path, dtype=np.float32, mode="r",
+                                   offset=header["embeddings"]["offset"], shape=(count, dim))
+        else:
+            embeddings = np.frombuffer(_read_section(f, header["embeddings"]), dtype=np.float32).reshape(count, dim)
+        records = [json.loads(line) for line in _read_section(f, header["payload"]).decode("utf-8").splitlines()]
+
+    if len(records) != count:
+        raise ValueError(f"В снимке {len(records)} записей вместо {count}")
+
+    chunking = header["chunking"]
+    collection_metadata = {
+        "embedding_model": header["embedding_model"],
+        "embedding_api": header["embedding_api"],
+        "chunk_size": chunking["chunk_size"],
+        "chunk_overlap": chunking["chunk_overlap"],
+        "group_by": chunking.get("group_by") or "none",
+        "group_max_tokens": chunking.get("group_max_tokens", INGEST_GROUP_MAX_TOKENS),
+    }
+
+    # Загружаем во временную коллекцию и подменяем рабочую только после успеха,
+    # чтобы сбой посреди импорта не оставил узел с частичным индексом
+    staging = VectorStore(collection_name=f"{vector_store.collection_name}{SNAPSHOT_STAGING_SUFFIX}")
+    try:
+        staging.reset_collection(metadata=collection_metadata)
+        for start in range(0, count, SNAPSHOT_BATCH_SIZE):
+            batch = records[start:start + SNAPSHOT_BATCH_SIZE]
+            staging.add_embeddings(
+                ids=[doc_id for doc_id, _, _ in batch],
+                embeddings=embeddings[start:start + len(batch)].tolist(),
+                documents=[document for _, document, _ in batch],
+                metadatas=[metadata for _, _, metadata in batch]
+            )
+        vector_store.replace_collection(staging)
+    except Exception:
+        try:
+            staging.drop_collection()
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось удалить временную коллекцию '{staging.collection_name}': {e}")
+        raise
+
+    logging.info(f"✅ Снимок загружен в коллекцию '{vector_store.collection_name}'.")
+    return header
@@ -1,12 +1,17 @@
 # src/qa_pipeline.py
 import logging
-from typing import List, Dict, Any
-from src.vector_store import VectorStore
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+import pandas as pd
+from src.vector_store import VectorStore, EMBEDDING_API
 from src.llm_interface import OllamaLLM
-from src.text_formatter import format_row_as_text, chunk_text
+from src.text_formatter import (
+    format_row_as_text, format_group_header, format_group_row, chunk_text, count_tokens
+)
 from src.semantic_search import retrieve_context
 from src.config import (
-    OLLAMA_MODEL, CHUNK_SIZE, CHUNK_OVERLAP,
+    OLLAMA_MODEL, EMBEDDING_MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP, INGEST_GROUP_BY, INGEST_GROUP_KEYS,
+    INGEST_GROUP_MAX_TOKENS,
     RETRIEVAL_TOP_K, ENABLE_MULTI_QUERY_RETRIEVAL, MULTI_QUERY_GENERATION_COUNT
 )
 import re
@@ -53,33 +58,122 @@ MULTI_QUERY_PROMPT = """Ты — эксперт по генерации поис
 """
 
 
-def ingest_data(rows: List[Dict]):
+def _pack_grouped_rows(rows: List[Dict], group_by: str, max_tokens: int, chunk_size: int,
+                       chunk_overlap: int) -> List[Tuple[str, List[Any]]]:
+    """
+    Упаковывает строки с общим ключом (например, продукт+период) в документы
+    не длиннее max_tokens токенов. Общие для группы поля (включая ключ) пишутся
+    один раз в заголовке, для каждой строки — только отличающиеся значения.
+    Возвращает пары (текст, список row_id).
+    """
+    key_columns = INGEST_GROUP_KEYS[group_by]
+    groups: Dict[Any, List[Tuple[Dict, Any]]] = {}
+    for i, row in enumerate(rows):
+        row_id = row.get("row_id", i + 1)
+        key = tuple(row.get(column) for column in key_columns)
+        if any(value is None or pd.isna(value) for value in key):
+            key = ("row", row_id)  # Строка без ключа группируется сама с собой
+        groups.setdefault(key, []).append((row, row_id))
+
+    documents = []
+    for group_rows in groups.values():
+        if len(group_rows) == 1:
+            # Одиночная строка индексируется как при инжесте без группировки
+            row, row_id = group_rows[0]
+            documents.extend((chunk, [row_id]) for chunk in
+                             chunk_text(format_row_as_text(row), chunk_size, chunk_overlap))
+            continue
+
+        first_row = group_rows[0][0]
+        fields = [key for key in first_row if key != "row_id"]
+        shared = {key: first_row[key] for key in fields
+                  if all(row.get(key) == first_row[key] for row, _ in group_rows)}
+        columns = [key for key in fields if key not in shared]
+
+        header = format_group_header(shared, columns)
+        header_tokens = count_tokens(header) + 1  # +1 на разделитель строк
+        current_lines, current_ids, current_tokens = [], [], header_tokens
+        for row, row_id in group_rows:
+            line = format_group_row(row, columns)
+            tokens = count_tokens(line) + 1
+            if header_tokens + tokens > max_tokens:
+                # Строка даже с заголовком не помещается в бюджет — режем её как раньше
+                documents.extend((chunk, [row_id]) for chunk in
+                                 chunk_text(format_row_as_text(row), chunk_size, chunk_overlap))
+                continue
+            if current_lines and current_tokens + tokens > max_tokens:
+                documents.append(("\n".join([header] + current_lines), current_ids))
+                current_lines, current_ids, current_tokens = [], [], header_tokens
+            current_lines.append(line)
+            current_ids.append(row_id)
+            current_tokens += tokens
+        if current_lines:
+            documents.append(("\n".join([header] + current_lines), current_ids))
+    return documents
+
+
+def chunk_row_ids(metadata: Dict[str, Any]) -> List[str]:
+    """
+    Возвращает row_id всех строк, вошедших в чанк.
+    Сгруппированные документы хранят их списком через запятую в "row_ids".
+    """
+    if metadata.get("row_ids"):
+        return str(metadata["row_ids"]).split(",")
+    return [str(metadata.get("row_id", "N/A"))]
+
+
+def ingest_data(rows: List[Dict], vector_store: Optional[VectorStore] = None,
+                chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                group_by: Optional[str] = INGEST_GROUP_BY,
+                group_max_tokens: int = INGEST_GROUP_MAX_TOKENS) -> int:
     """
     Обрабатывает и индексирует данные в векторном хранилище.
+    По умолчанию использует общее хранилище и параметры чанкинга из config.
+    При заданном group_by строки с общим ключом упаковываются в документы
+    до group_max_tokens токенов.
+    Возвращает количество добавленных чанков.
     """
-    logging.info(f"Начинаю инжест {len(rows)} строк данных...")
-    vector_store_instance.reset_collection()  # Очищаем коллекцию перед новым инжестом
+    if vector_store is None:
+        vector_store = vector_store_instance
+    if group_by is not None and group_by not in INGEST_GROUP_KEYS:
+        raise ValueError(f"Неизвестный режим группировки: {group_by}. Допустимо: {list(INGEST_GROUP_KEYS)}")
+
+    logging.info(f"Начинаю инжест {len(rows)} строк данных (группировка: {group_by})...")
+    # Очищаем коллекцию перед новым инжестом и запоминаем параметры индексации (нужны для снимков)
+    collection_metadata = {"embedding_model": EMBEDDING_MODEL_NAME, "embedding_api": EMBEDDING_API,
+                           "chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+                           "group_by": group_by or "none", "group_max_tokens": group_max_tokens}
+    vector_store.reset_collection(metadata=collection_metadata)
 
     all_chunks = []
     all_metadatas = []
     all_ids = []
 
-    for i, row in enumerate(rows):
-        # Форматируем строку в текст
-        text_data = format_row_as_text(row)
-
-        # Разбиваем текст на чанки
-        chunks = chunk_text(text_data, CHUNK_SIZE, CHUNK_OVERLAP)
-
-        for j, chunk in enumerate(chunks):
-            all_chunks.append(chunk)
-            # Добавляем метаданные, включая row_id для отслеживания источника
-            all_metadatas.append({"row_id": row.get("row_id", i + 1), "source_file": "test_data.csv"})
-            all_ids.append(f"doc_{row.get('row_id', i + 1)}_chunk_{j}")
+    if group_by is not None:
+        packed_documents = _pack_grouped_rows(rows, group_by, group_max_tokens, chunk_size, chunk_overlap)
+        for n, (document, row_ids) in enumerate(packed_documents):
+            all_chunks.append(document)
+            # Сохраняем все row_id группы, чтобы источники ссылались на отдельные строки
+            all_metadatas.append({"row_ids": ",".join(str(r) for r in row_ids), "source_file": "test_data.csv"})
+            all_ids.append(f"group_{group_by}_{n}")
+    else:
+        for i, row in enumerate(rows):
+            # Форматируем строку в текст
+            text_data = format_row_as_text(row)
+
+            # Разбиваем текст на чанки
+            chunks = chunk_text(text_data, chunk_size, chunk_overlap)
+
+            for j, chunk in enumerate(chunks):
+                all_chunks.append(chunk)
+                # Добавляем метаданные, включая row_id для отслеживания источника
+                all_metadatas.append({"row_id": row.get("row_id", i + 1), "source_file": "test_data.csv"})
+                all_ids.append(f"doc_{row.get('row_id', i + 1)}_chunk_{j}")
 
     logging.info(f"Добавляю {len(all_chunks)} чанков в векторное хранилище...")
-    vector_store_instance.add_chunks(all_chunks, all_metadatas, all_ids)
+    vector_store.add_chunks(all_chunks, all_metadatas, all_ids)
     logging.info("✅ Данные успешно добавлены в векторное хранилище.")
+    return len(all_chunks)
 
 
 def _generate_alternative_queries(original_query: str, count: int) -> List[str]:
@@ -101,50 +195,77 @@ def _generate_alternative_queries(original_query: str, count: int) -> List[str]:
         return [original_query]
 
 
-def ask_question(question: str) -> Dict[str, Any]:
+def retrieve_chunks(question: str, vector_store: VectorStore, top_k: int,
+                    multi_query_count: int) -> List[Dict[str, Any]]:
     """
-    Обрабатывает вопрос пользователя, выполняет RAG-пайплайн и возвращает ответ.
+    Выполняет (мульти-запросный) семантический поиск и возвращает
+    уникальные чанки, отсортированные по релевантности.
+    При multi_query_count == 0 альтернативные запросы не генерируются.
     """
-    logging.info(f"Начинаю обработку вопроса: '{question}'")
-
     all_retrieved_chunks = []
     queries_to_search = [question]
 
-    if ENABLE_MULTI_QUERY_RETRIEVAL:
-        alternative_queries = _generate_alternative_queries(question, MULTI_QUERY_GENERATION_COUNT)
+    if multi_query_count > 0:
+        alternative_queries = _generate_alternative_queries(question, multi_query_count)
         queries_to_search.extend(alternative_queries)
         # Удаляем мусор и сохраняем порядок
         queries_to_search = list(dict.fromkeys(queries_to_search))
 
-    for q in queries_to_search:
-        logging.info(f"Запуск семантического поиска для запроса: '{q}' (top_k={RETRIEVAL_TOP_K})")
+    def _search(q: str) -> List[Dict[str, Any]]:
+        logging.info(f"Запуск семантического поиска для запроса: '{q}' (top_k={top_k})")
         try:
-            retrieved_chunks_for_query = retrieve_context(q, vector_store_instance, top_k=RETRIEVAL_TOP_K)
-            all_retrieved_chunks.extend(retrieved_chunks_for_query)
+            return retrieve_context(q, vector_store, top_k=top_k)
         except Exception as e:
             logging.error(f"❌ Ошибка при выполнении семантического поиска для запроса '{q}': {e}")
+            return []
+
+    # Запросы ищем параллельно, чтобы их эмбеддинги попали в один батч
+    with ThreadPoolExecutor(max_workers=len(queries_to_search)) as executor:
+        for retrieved_chunks_for_query in executor.map(_search, queries_to_search):
+            all_retrieved_chunks.extend(retrieved_chunks_for_query)
 
     # Удаляем дубликаты чанков (если один и тот же чанк найден по разным запросам)
-    # Используем ID чанка для уникальности
-    unique_chunks_map = {chunk["id"]: chunk for chunk in all_retrieved_chunks if "id" in chunk}
+    # по ID документа в Chroma, оставляя вхождение с наименьшим расстоянием
+    unique_chunks_map = {}
+    for chunk in all_retrieved_chunks:
+        known = unique_chunks_map.get(chunk["id"])
+        if known is None or chunk["distance"] < known["distance"]:
+            unique_chunks_map[chunk["id"]] = chunk
     final_retrieved_chunks = list(unique_chunks_map.values())
 
-    if not final_retrieved_chunks:
-        logging.warning("Не найдено релевантных чанков для вопроса.")
-        return {
-            "answer": "Извините, я не могу ответить на этот вопрос на основе предоставленных данных, так как не найдено релевантной информации.",
-            "sources": []}
-
     # Сортируем чанки по релевантности (по расстоянию)
     final_retrieved_chunks.sort(key=lambda x: x.get("distance", 0.0))
+    return final_retrieved_chunks
 
-    # Формируем контекст для LLM
-    context_texts = [chunk["text"] for chunk in final_retrieved_chunks]
+
+def build_prompt(question: str, chunks: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+    """
+    Формирует промпт для LLM из найденных чанков.
+    Возвращает промпт и список текстов контекста.
+    """
+    context_texts = [chunk["text"] for chunk in chunks]
     context = "\n\n".join(context_texts)
     logging.info(f"Найден контекст (первые 200 символов): {context[:200]}...")
+    return SYSTEM_PROMPT.format(context=context, question=question), context_texts
+
+
+def ask_question(question: str) -> Dict[str, Any]:
+    """
+    Обрабатывает вопрос пользователя, выполняет RAG-пайплайн и возвращает ответ.
+    """
+    logging.info(f"Начинаю обработку вопроса: '{question}'")
+
+    multi_query_count = MULTI_QUERY_GENERATION_COUNT if ENABLE_MULTI_QUERY_RETRIEVAL else 0
+    final_retrieved_chunks = retrieve_chunks(question, vector_store_instance, RETRIEVAL_TOP_K, multi_query_count)
+
+    if not final_retrieved_chunks:
+        logging.warning("Не найдено релевантных чанков для вопроса.")
+        return {
+            "answer": "Извините, я не могу ответить на этот вопрос на основе предоставленных данных, так как не найдено релевантной информации.",
+            "sources": []}
 
     # Формируем промпт для LLM
-    prompt = SYSTEM_PROMPT.format(context=context, question=question)
+    prompt, context_texts = build_prompt(question, final_retrieved_chunks)
 
     # Получаем ответ от LLM
     try:
@@ -157,9 +278,9 @@ def ask_question(question: str) -> Dict[str, Any]:
     # Извлекаем источники
     sources = []
     for chunk in final_retrieved_chunks:
-        row_id = chunk["metadata"].get("row_id", "N/A")
         source_file = chunk["metadata"].get("source_file", "N/A")
-        sources.append(f"Строка {row_id} из {source_file}")
+        for row_id in chunk_row_ids(chunk["metadata"]):
+            sources.append(f"Строка {row_id} из {source_file}")
 
     # Уникальные и отсортированные источники
     unique_sources = sorted(list(set(sources)))
@@ -0,0 +1,163 @@
+# src/retrieval_tuner.py
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from typing import List, Dict, Any, Optional
+
+import pandas as pd
+
+from src.vector_store import VectorStore
+from src.text_formatter import count_tokens
+from src.qa_pipeline import ingest_data, retrieve_chunks, build_prompt, chunk_row_ids, llm_instance
+from src.config import TUNING_COLLECTION_NAME, INGEST_GROUP_BY
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Сетка перебора по умолчанию (имена совпадают с константами в src/config.py)
+DEFAULT_TUNING_GRID = {
+    "CHUNK_SIZE": [150, 300, 500],
+    "CHUNK_OVERLAP": [0, 50],
+    "RETRIEVAL_TOP_K": [5, 10, 15],
+    "MULTI_QUERY_GENERATION_COUNT": [0, 1, 3],
+}
+
+
+def load_labeled_questions(file_path: str) -> List[Dict]:
+    """
+    Загружает размеченные вопросы (колонки question, row_id),
+    сгенерированные generate_test_data.generate_test_questions.
+    """
+    df = pd.read_csv(file_path)
+    questions = df[["question", "row_id"]].to_dict(orient='records')
+    logging.info(f"✅ Загружено {len(questions)} размеченных вопросов из {file_path}")
+    return questions
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    """
+    Перцентиль методом ближайшего ранга.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def evaluate_config(questions: List[Dict], vector_store: VectorStore, top_k: int,
+                    multi_query_count: int, generate_answer: bool = True) -> Dict[str, Any]:
+    """
+    Прогоняет размеченные вопросы через пайплайн на уже проиндексированной коллекции.
+    Считает recall@k по row_id (по top_k лучшим чанкам после слияния запросов),
+    токены промпта и сквозную задержку.
+    """
+    hits = 0
+    prompt_tokens = []
+    latencies_ms = []
+
+    for item in questions:
+        started = time.perf_counter()
+        chunks = retrieve_chunks(item["question"], vector_store, top_k, multi_query_count)
+        prompt, _ = build_prompt(item["question"], chunks)
+        if generate_answer and chunks:
+            llm_instance.generate(prompt)
+        latencies_ms.append((time.perf_counter() - started) * 1000.0)
+
+        prompt_tokens.append(count_tokens(prompt))
+        # Мульти-запросный поиск возвращает до (N+1)*top_k чанков; для сравнения
+        # конфигураций при одном k recall считаем по первым top_k после слияния
+        retrieved_row_ids = {row_id for chunk in chunks[:top_k] for row_id in chunk_row_ids(chunk["metadata"])}
+        if str(item["row_id"]) in retrieved_row_ids:
+            hits += 1
+
+    total = len(questions)
+    return {
+        "recall_at_k": hits / total if total else 0.0,
+        "avg_prompt_tokens": sum(prompt_tokens) / total if total else 0.0,
+        "p50_latency_ms": _percentile(latencies_ms, 50),
+        "p95_latency_ms": _percentile(latencies_ms, 95),
+    }
+
+
+def _select_best(results: List[Dict[str, Any]], latency_budget_ms: float) -> Optional[Dict[str, Any]]:
+    """
+    Лучшая конфигурация в рамках бюджета p95: максимальный recall,
+    при равенстве — меньше токенов промпта, затем меньше задержка.
+    """
+    within_budget = [r for r in results if r["metrics"]["p95_latency_ms"] <= latency_budget_ms]
+    if not within_budget:
+        return None
+    return min(within_budget, key=lambda r: (-r["metrics"]["recall_at_k"],
+                                             r["metrics"]["avg_prompt_tokens"],
+                                             r["metrics"]["p95_latency_ms"]))
+
+
+def tune_retrieval(rows: List[Dict], questions: List[Dict], latency_budget_ms: float,
+                   grid: Optional[Dict[str, List[int]]] = None,
+                   generate_answer: bool = True,
+                   group_by: Optional[str] = INGEST_GROUP_BY) -> Dict[str, Any]:
+    """
+    Перебирает параметры поиска по сетке и возвращает все замеры и лучшую
+    конфигурацию под бюджет p95. Индекс перестраивается один раз на каждую
+    пару CHUNK_SIZE/CHUNK_OVERLAP во временной коллекции.
+    """
+    grid = grid or DEFAULT_TUNING_GRID
+    vector_store = VectorStore(collection_name=TUNING_COLLECTION_NAME)
+    results = []
+
+    try:
+        for chunk_size, chunk_overlap in itertools.product(grid["CHUNK_SIZE"], grid["CHUNK_OVERLAP"]):
+            if chunk_overlap >= chunk_size:
+                logging.warning(f"Пропускаю CHUNK_SIZE={chunk_size}, CHUNK_OVERLAP={chunk_overlap}: перекрытие >= размера")
+                continue
+
+            started = time.perf_counter()
+            chunk_count = ingest_data(rows, vector_store=vector_store, chunk_size=chunk_size,
+                                      chunk_overlap=chunk_overlap, group_by=group_by)
+            ingest_seconds = time.perf_counter() - started
+
+            for top_k, multi_query_count in itertools.product(grid["RETRIEVAL_TOP_K"],
+                                                              grid["MULTI_QUERY_GENERATION_COUNT"]):
+                config = {
+                    "CHUNK_SIZE": chunk_size,
+                    "CHUNK_OVERLAP": chunk_overlap,
+                    "RETRIEVAL_TOP_K": top_k,
+                    "MULTI_QUERY_GENERATION_COUNT": multi_query_count,
+                }
+                logging.info(f"Оцениваю конфигурацию {config}")
+                metrics = evaluate_config(questions, vector_store, top_k, multi_query_count, generate_answer)
+                metrics["ingest_seconds"] = ingest_seconds
+                metrics["chunk_count"] = chunk_count
+                logging.info(f"Результат: {metrics}")
+                results.append({"config": config, "metrics": metrics})
+    finally:
+        vector_store.drop_collection()
+
+    best = _select_best(results, latency_budget_ms)
+    if best is None:
+        logging.warning(f"Ни одна конфигурация не укладывается в бюджет p95 {latency_budget_ms} мс.")
+    else:
+        logging.info(f"✅ Лучшая конфигурация: {best['config']} ({best['metrics']})")
+
+    return {
+        "latency_budget_ms": latency_budget_ms,
+        "generate_answer": generate_answer,
+        "group_by": group_by,
+        "best": best,
+        "results": results,
+    }
+
+
+def save_tuning_result(result: Dict[str, Any], output_file: str):
+    """
+    Сохраняет результат подбора параметров в JSON.
+    """
+    output_dir = os.path.dirname(output_file)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    logging.info(f"Результат подбора сохранён в {output_file}")
@@ -9,16 +9,12 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 def retrieve_context(query: str, vector_store: VectorStore, top_k: int = 5) -> List[Dict[str, Any]]:
     """
     Извлекает релевантные чанки из векторного хранилища на основе запроса.
+    У каждого чанка поле "id" — идентификатор документа в Chroma,
+    одинаковый для одного чанка при любых запросах (по нему идёт дедупликация).
     """
     logging.info(f"Запуск семантического поиска для запроса: '{query[:50]}...' (top_k={top_k})")
     try:
-        retrieved_chunks = vector_store.search(query, top_k=top_k)
-
-        # Добавляем ID к каждому чанку для дедупликации
-        for i, chunk in enumerate(retrieved_chunks):
-            chunk["id"] = f"{chunk['metadata'].get('row_id')}_{i}_{hash(chunk['text'])}"  # Уникальный ID для чанка
-
-        return retrieved_chunks
+        return vector_store.search(query, top_k=top_k)
     except Exception as e:
         logging.error(f"❌ Ошибка при выполнении семантического поиска: {e}")
         raise
\ No newline at end of file
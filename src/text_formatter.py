@@ -34,6 +34,32 @@ def format_row_as_text(row: Dict) -> str:
     return "; ".join(formatted_parts) + "."
 
 
+def format_group_header(shared_fields: Dict, columns: List[str]) -> str:
+    """
+    Заголовок документа из сгруппированных строк: общие поля один раз
+    и названия столбцов, значения которых различаются по строкам.
+    """
+    return f"{format_row_as_text(shared_fields)}\nСтолбцы: {' | '.join(columns)}"
+
+
+def format_group_row(row: Dict, columns: List[str]) -> str:
+    """
+    Строка сгруппированного документа: только значения отличающихся столбцов.
+    """
+    return " | ".join(str(row.get(column, "")) for column in columns)
+
+
+def count_tokens(text: str) -> int:
+    """
+    Считает количество токенов в тексте тем же кодировщиком, что и chunk_text.
+    """
+    try:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return len(text.split())  # Приближенно, 1 слово = 1 токен
+    return len(encoding.encode(text))
+
+
 def chunk_text(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
     """
     Разбивает текст на чанки с заданным размером и перекрытием.
@@ -1,37 +1,169 @@
 # src/vector_store.py
 
+import logging
+import threading
 import chromadb
-from chromadb.utils.embedding_functions import OllamaEmbeddingFunction
-from typing import List, Dict
+import requests
+from chromadb import Documents, EmbeddingFunction, Embeddings
+from typing import List, Dict, Optional
 from src.config import (
     VECTOR_DB_PATH,
     COLLECTION_NAME,
     OLLAMA_BASE_URL,
-    EMBEDDING_MODEL_NAME
+    EMBEDDING_MODEL_NAME,
+    EMBEDDING_HTTP_BATCH_SIZE,
+    EMBEDDING_HTTP_TIMEOUT,
+    ENABLE_QUERY_EMBEDDING_BATCHING,
+    QUERY_EMBEDDING_BATCH_MAX_SIZE,
+    QUERY_EMBEDDING_BATCH_MAX_WAIT_MS,
+    QUERY_EMBEDDING_MAX_IN_FLIGHT,
+    QUERY_EMBEDDING_RESULT_TIMEOUT
 )
+from src.embedding_batcher import QueryEmbeddingBatcher
+
+# Метка пространства векторов в метаданных коллекции: документы посчитаны через
+# /api/embed (нормированные векторы). Коллекции без метки собраны старым
+# /api/embeddings и несовместимы с эмбеддингами запросов — нужен повторный инжест.
+EMBEDDING_API = "embed"
+REPLACED_COLLECTION_SUFFIX = "_replaced"
+EMBEDDING_API_MISMATCH_MESSAGE = (
+    "Коллекция '{name}' собрана без метки embedding_api='" + EMBEDDING_API + "' "
+    "(старый эндпоинт /api/embeddings, ненормированные векторы). "
+    "Поиск по ней даст неверную выдачу — выполните повторный инжест."
+)
+
+
+class OllamaBatchEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Эмбеддинги через батчевый эндпоинт Ollama /api/embed:
+    один HTTP-запрос на каждые EMBEDDING_HTTP_BATCH_SIZE текстов.
+    Используется и для документов, и для запросов, чтобы векторы
+    считались одним эндпоинтом (/api/embed возвращает нормированные векторы).
+    """
+
+    def __init__(self, base_url: str, model_name: str):
+        self.url = f"{base_url}/api/embed"
+        self.model_name = model_name
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        embeddings = []
+        for start in range(0, len(texts), EMBEDDING_HTTP_BATCH_SIZE):
+            batch = texts[start:start + EMBEDDING_HTTP_BATCH_SIZE]
+            response = requests.post(
+                self.url,
+                json={"model": self.model_name, "input": batch},
+                timeout=EMBEDDING_HTTP_TIMEOUT
+            )
+            if response.status_code != 200:
+                raise RuntimeError(f"Ollama вернул статус {response.status_code}: {response.text}")
+            batch_embeddings = response.json().get("embeddings") or []
+            if len(batch_embeddings) != len(batch):
+                raise RuntimeError(f"Ожидалось {len(batch)} эмбеддингов, получено {len(batch_embeddings)}")
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+
+_shared_query_batcher: Optional[QueryEmbeddingBatcher] = None
+_shared_query_batcher_lock = threading.Lock()
+
+
+def _get_shared_query_batcher() -> Optional[QueryEmbeddingBatcher]:
+    """
+    Один батчер эмбеддингов запросов на процесс: все экземпляры VectorStore
+    (рабочий, тюнинга, временные для импорта снимков) делят его потоки и батчи.
+    """
+    global _shared_query_batcher
+    if not ENABLE_QUERY_EMBEDDING_BATCHING:
+        return None
+    with _shared_query_batcher_lock:
+        if _shared_query_batcher is None:
+            _shared_query_batcher = QueryEmbeddingBatcher(
+                OllamaBatchEmbeddingFunction(OLLAMA_BASE_URL, EMBEDDING_MODEL_NAME),
+                max_batch_size=QUERY_EMBEDDING_BATCH_MAX_SIZE,
+                max_wait_ms=QUERY_EMBEDDING_BATCH_MAX_WAIT_MS,
+                max_in_flight=QUERY_EMBEDDING_MAX_IN_FLIGHT,
+                result_timeout=QUERY_EMBEDDING_RESULT_TIMEOUT
+            )
+        return _shared_query_batcher
 
 
 class VectorStore:
-    def __init__(self):
-        self.embedding_fn = OllamaEmbeddingFunction(
-            url=f"{OLLAMA_BASE_URL}/api/embeddings",
-            model_name=EMBEDDING_MODEL_NAME
-        )
+    def __init__(self, collection_name: str = COLLECTION_NAME):
+        self.collection_name = collection_name
+        self.embedding_fn = OllamaBatchEmbeddingFunction(OLLAMA_BASE_URL, EMBEDDING_MODEL_NAME)
+        # Эмбеддинги запросов из одновременных поисков объединяются в общие батчи
+        self.query_batcher = _get_shared_query_batcher()
         self.client = chromadb.PersistentClient(path=VECTOR_DB_PATH)
-        self.collection = self.client.get_or_create_collection(
-            name=COLLECTION_NAME,
-            embedding_function=self.embedding_fn
-        )
+        try:
+            self.collection = self.client.get_or_create_collection(
+                name=self.collection_name,
+                embedding_function=self.embedding_fn
+            )
+        except ValueError as e:
+            # Коллекция сохранена с другой функцией эмбеддингов (старый OllamaEmbeddingFunction).
+            # Открываем её как есть, чтобы узел поднялся и индекс можно было пересобрать инжестом.
+            logging.error(f"❌ Конфликт функции эмбеддингов коллекции '{self.collection_name}': {e}")
+            self.collection = self.client.get_collection(name=self.collection_name)
+        if not self.is_embedding_api_compatible():
+            logging.error(EMBEDDING_API_MISMATCH_MESSAGE.format(name=self.collection_name))
+
+    def is_embedding_api_compatible(self) -> bool:
+        """
+        Проверяет, что векторы коллекции посчитаны тем же эндпоинтом, что и запросы.
+        Пустая коллекция совместима: её заполнит инжест или импорт снимка.
+        """
+        metadata = self.collection.metadata or {}
+        return metadata.get("embedding_api") == EMBEDDING_API or self.collection.count() == 0
 
-    def reset_collection(self):
+    def reset_collection(self, metadata: Optional[Dict] = None):
         """
         Удаляет и пересоздаёт коллекцию.
+        В metadata можно сохранить параметры индексации (модель, чанкинг).
         """
-        self.client.delete_collection(name=COLLECTION_NAME)
+        self.client.delete_collection(name=self.collection_name)
         self.collection = self.client.create_collection(
-            name=COLLECTION_NAME,
+            name=self.collection_name,
+            embedding_function=self.embedding_fn,
+            metadata=metadata or None
+        )
+
+    def drop_collection(self):
+        """
+        Удаляет коллекцию без пересоздания (для временных коллекций).
+        """
+        self.client.delete_collection(name=self.collection_name)
+
+    def replace_collection(self, other: "VectorStore"):
+        """
+        Подменяет коллекцию полностью подготовленной коллекцией other
+        (переименованием, без копирования данных).
+        Рабочая коллекция сначала откладывается под временным именем и удаляется
+        только после успешной подмены; при сбое переименования она возвращается на место.
+        Пока идёт подмена, поиски продолжают работать по прежнему объекту коллекции.
+        """
+        backup_name = f"{self.collection_name}{REPLACED_COLLECTION_SUFFIX}"
+        try:
+            self.client.delete_collection(name=backup_name)  # Остаток прерванной подмены
+        except Exception:
+            pass
+
+        live_collection = self.collection
+        live_collection.modify(name=backup_name)
+        try:
+            other.collection.modify(name=self.collection_name)
+        except Exception:
+            live_collection.modify(name=self.collection_name)
+            raise
+
+        self.collection = self.client.get_collection(
+            name=self.collection_name,
             embedding_function=self.embedding_fn
         )
+        try:
+            self.client.delete_collection(name=backup_name)
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось удалить прежнюю коллекцию '{backup_name}': {e}")
 
     def get_stats(self) -> dict:
         """
@@ -40,28 +172,50 @@ class VectorStore:
         count = self.collection.count()
         return {
             "count": count,
-            "collection_name": COLLECTION_NAME,
+            "collection_name": self.collection_name,
             "embedding_model": EMBEDDING_MODEL_NAME,
-            "db_path": VECTOR_DB_PATH
+            "embedding_api": (self.collection.metadata or {}).get("embedding_api"),
+            "embedding_api_compatible": self.is_embedding_api_compatible(),
+            "db_path": VECTOR_DB_PATH,
+            "query_embedding_batching": self.query_batcher.get_stats() if self.query_batcher else None
         }
 
     def add_chunks(self, chunks: List[str], metadatas: List[Dict], ids: List[str]):
         clean_meta = [{k: str(v) for k, v in m.items()} for m in metadatas]
         self.collection.add(documents=chunks, metadatas=clean_meta, ids=ids)
 
+    def add_embeddings(self, ids: List[str], embeddings: List[List[float]],
+                       documents: List[str], metadatas: List[Dict]):
+        """
+        Добавляет чанки с готовыми эмбеддингами (без обращения к Ollama).
+        """
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
     def search(self, query: str, top_k: int = 15) -> List[Dict]:
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=top_k,
-            include=["documents", "metadatas", "distances"]
-        )
+        if not self.is_embedding_api_compatible():
+            raise RuntimeError(EMBEDDING_API_MISMATCH_MESSAGE.format(name=self.collection_name))
+        if self.query_batcher:
+            results = self.collection.query(
+                query_embeddings=[self.query_batcher.embed(query)],
+                n_results=top_k,
+                include=["documents", "metadatas", "distances"]
+            )
+        else:
+            results = self.collection.query(
+                query_texts=[query],
+                n_results=top_k,
+                include=["documents", "metadatas", "distances"]
+            )
+        # ids Chroma возвращает всегда: это стабильный идентификатор документа для дедупликации
         return [
             {
+                "id": doc_id,
                 "text": doc or "",
                 "metadata": meta or {},
                 "distance": dist or 1.0
             }
-            for doc, meta, dist in zip(
+            for doc_id, doc, meta, dist in zip(
+                results["ids"][0],
                 results["documents"][0],
                 results["metadatas"][0],
                 results["distances"][0]
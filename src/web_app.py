@@ -9,6 +9,8 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Импорты всех необходимых модулей для работы приложения
 from src.data_loader import load_table_data
 from src.qa_pipeline import ingest_data, ask_question, vector_store_instance
+from src.index_snapshot import export_snapshot, import_snapshot
+from src.config import INGEST_GROUP_BY, INGEST_GROUP_KEYS, SNAPSHOT_DIR
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 TEMPLATES_DIR = os.path.join(PROJECT_ROOT, "templates")
@@ -42,11 +44,19 @@ def api_ingest():
     """
     API-эндпоинт для загрузки и индексации данных.
     Читает данные из test_data.csv и передает их в qa_pipeline для инжеста.
+    Необязательный параметр group_by ("product_period" / "customer_period")
+    упаковывает строки с общим ключом в один документ.
     Соответствует требованию ТЗ: "Загрузка и индексация данных (ингест)".
     """
     logging.info("Получен запрос на инжест данных.")
     data_path = os.path.join(PROJECT_ROOT, "data", "test_data.csv")
 
+    params = request.get_json(silent=True) or {}
+    group_by = params.get("group_by", INGEST_GROUP_BY) or None
+    if group_by is not None and group_by not in INGEST_GROUP_KEYS:
+        logging.warning(f"Неизвестный режим группировки: {group_by}")
+        return jsonify({"error": f"Неизвестный режим группировки: {group_by}"}), 400
+
     # Проверяем наличие файла данных
     if not os.path.exists(data_path):
         logging.error(f"Файл данных не найден: {data_path}")
@@ -54,9 +64,9 @@ def api_ingest():
 
     try:
         rows = load_table_data(data_path) # Загрузка данных
-        ingest_data(rows) # Индексация данных
-        logging.info(f"Успешно инжестировано {len(rows)} строк.")
-        return jsonify({"status": "success", "rows": len(rows)})
+        chunks = ingest_data(rows, group_by=group_by) # Индексация данных
+        logging.info(f"Успешно инжестировано {len(rows)} строк в {chunks} чанков.")
+        return jsonify({"status": "success", "rows": len(rows), "chunks": chunks})
     except Exception as e:
         logging.exception(f"Ошибка при инжесте данных: {e}") # Логируем исключение с traceback
         return jsonify({"error": str(e)}), 500
@@ -114,6 +124,62 @@ def api_index_stats():
         return jsonify({"error": str(e)}), 500
 
 
+def _snapshot_path(name: str) -> str:
+    """
+    Путь к файлу снимка внутри SNAPSHOT_DIR (имя без каталогов).
+    """
+    return os.path.join(SNAPSHOT_DIR, os.path.basename(name or "index_snapshot.ragsnap"))
+
+
+@app.route("/api/snapshot/export", methods=["POST"])
+def api_snapshot_export():
+    """
+    API-эндпоинт для экспорта активной коллекции в файл снимка в SNAPSHOT_DIR.
+    Параметры: name (имя файла), compress_embeddings (по умолчанию true).
+    """
+    logging.info("Получен запрос на экспорт снимка индекса.")
+    params = request.get_json(silent=True) or {}
+    snapshot_path = _snapshot_path(params.get("name"))
+    try:
+        header = export_snapshot(vector_store_instance, snapshot_path,
+                                 compress_embeddings=params.get("compress_embeddings", True))
+        return jsonify({"status": "success", "path": snapshot_path, "count": header["count"],
+                        "embedding_model": header["embedding_model"], "chunking": header["chunking"]})
+    except ValueError as e:
+        logging.error(f"Экспорт снимка отклонён: {e}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.exception(f"Ошибка при экспорте снимка: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/snapshot/import", methods=["POST"])
+def api_snapshot_import():
+    """
+    API-эндпоинт для загрузки снимка из SNAPSHOT_DIR без пересчёта эмбеддингов.
+    Параметры: name (имя файла), mmap (отобразить эмбеддинги в память).
+    Снимок с другой моделью эмбеддингов отклоняется.
+    """
+    logging.info("Получен запрос на импорт снимка индекса.")
+    params = request.get_json(silent=True) or {}
+    snapshot_path = _snapshot_path(params.get("name"))
+
+    if not os.path.exists(snapshot_path):
+        logging.error(f"Файл снимка не найден: {snapshot_path}")
+        return jsonify({"error": f"Файл не найден: {snapshot_path}"}), 400
+
+    try:
+        header = import_snapshot(vector_store_instance, snapshot_path, use_mmap=params.get("mmap", False))
+        return jsonify({"status": "success", "path": snapshot_path, "count": header["count"],
+                        "embedding_model": header["embedding_model"], "chunking": header["chunking"]})
+    except ValueError as e:
+        logging.error(f"Снимок отклонён: {e}")
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logging.exception(f"Ошибка при импорте снимка: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 if __name__ == "__main__":
     logging.info("Запуск Flask-приложения...")
     # Запуск Flask-сервера.
@@ -0,0 +1,42 @@
+# tune_retrieval.py
+import argparse
+import logging
+
+from src.data_loader import load_table_data
+from src.retrieval_tuner import load_labeled_questions, tune_retrieval, save_tuning_result
+from src.config import INGEST_GROUP_BY, INGEST_GROUP_KEYS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Подбор CHUNK_SIZE, CHUNK_OVERLAP, RETRIEVAL_TOP_K и MULTI_QUERY_GENERATION_COUNT "
+                    "под бюджет задержки p95.")
+    parser.add_argument("--budget-ms", type=float, required=True, help="Бюджет сквозной задержки p95, мс")
+    parser.add_argument("--data", default="data/test_data.csv", help="CSV с данными для индексации")
+    parser.add_argument("--questions", default="data/test_questions.csv",
+                        help="CSV с размеченными вопросами (generate_test_data.py)")
+    parser.add_argument("--output", default="data/tuning_result.json", help="Куда сохранить результат")
+    parser.add_argument("--no-generate", action="store_true",
+                        help="Не вызывать LLM для ответа (замерять только поиск и сборку промпта)")
+    parser.add_argument("--group-by", default=INGEST_GROUP_BY, choices=list(INGEST_GROUP_KEYS),
+                        help="Упаковывать строки с общим ключом в один документ")
+    args = parser.parse_args()
+
+    rows = load_table_data(args.data)
+    questions = load_labeled_questions(args.questions)
+    result = tune_retrieval(rows, questions, args.budget_ms, generate_answer=not args.no_generate,
+                            group_by=args.group_by)
+    save_tuning_result(result, args.output)
+
+    if result["best"]:
+        print("Лучшая конфигурация для src/config.py:")
+        for key, value in result["best"]["config"].items():
+            print(f"{key} = {value}")
+    else:
+        print(f"Ни одна конфигурация не укладывается в бюджет p95 {args.budget_ms} мс.")
+
+
+if __name__ == "__main__":
+    main()